@@ -14,22 +14,26 @@ Telegram Caller — Независимый скрипт для звонков ч
 """
 
 import asyncio
+import functools
 import hashlib
 import os
-import secrets
+import re
 import sys
+import threading
 from dataclasses import dataclass
 from enum import Enum
 from pathlib import Path
 from typing import Optional, Union
 
 try:
-    from telethon import TelegramClient, functions, types
+    from telethon import TelegramClient, functions, types, utils
     from telethon.errors import (
         SessionPasswordNeededError,
         PhoneCodeInvalidError,
         PhoneNumberInvalidError,
         FloodWaitError,
+        MsgWaitFailedError,
+        MultiError,
         UserPrivacyRestrictedError,
     )
 except ImportError:
@@ -37,6 +41,14 @@ except ImportError:
     print("   Установите: pip install telethon")
     sys.exit(1)
 
+try:
+    import gmpy2  # Опционально: ускоряет возведение в степень по модулю
+except ImportError:
+    gmpy2 = None
+
+# hashlib.sha256 работает через OpenSSL (с SHA-NI, если процессор умеет)
+_sha256 = hashlib.sha256
+
 
 # ═══════════════════════════════════════════════════════════════════════════════
 # НАСТРОЙКИ
@@ -46,6 +58,15 @@ SESSION_FILE = "caller_session"  # Имя файла сессии (без рас
 DEFAULT_RING_DURATION = 5.0      # Длительность звонка по умолчанию (секунды)
 CONFIG_FILE = "caller_config.txt"  # Файл для сохранения API credentials
 
+# Протокол звонка (одинаковый для всех звонков, создаётся один раз)
+_CALL_PROTOCOL = types.PhoneCallProtocol(
+    min_layer=92,
+    max_layer=92,
+    library_versions=('5.0.0', '6.0.0'),
+    udp_p2p=True,
+    udp_reflector=True
+)
+
 
 # ═══════════════════════════════════════════════════════════════════════════════
 # КЛАССЫ
@@ -68,11 +89,31 @@ class CallResult:
     message: str
 
 
+@functools.cache
+def _build_dh_table(generator, prime, bits: int = 256, window: int = 8) -> list:
+    """
+    Таблица степеней генератора для возведения в степень с фиксированным основанием
+    
+    table[i][k] = generator ** (k * 2 ** (window * i)) mod prime, поэтому
+    g^x считается произведением по одному элементу на каждое окно x.
+    Строится при первом обращении (~8 тыс. умножений, ~2 МБ) и кэшируется.
+    """
+    table = []
+    base = generator
+    for _ in range(bits // window):
+        row = [1, base]
+        for _ in range(2, 1 << window):
+            row.append(row[-1] * base % prime)
+        table.append(row)
+        base = row[-1] * base % prime
+    return table
+
+
 class TelegramCaller:
     """Класс для совершения звонков через Telegram"""
     
     # Стандартные DH параметры Telegram
-    DH_PRIME = int(
+    DH_PRIME_BYTES = bytes.fromhex(
         "C71CAEB9C6B1C9048E6C522F70F13F73980D40238E3E21C14934D037563D930F"
         "48198A0AA7C14058229493D22530F4DBFA336F6E0AC925139543AED44CCE7C37"
         "20FD51F69458705AC68CD4FE6B6B13ABDC9746512969328454F18FAF8C595F64"
@@ -80,17 +121,33 @@ class TelegramCaller:
         "A4A695811051907E162753B56B0F6B410DBA74D8A84B2A14B3144E0EF1284754"
         "FD17ED950D5965B4B9DD46582DB1178D169C6BC465B0D6FF9CA3928FEF5B9AE4"
         "E418FC15E83EBEA0F87FA9FF5EED70050DED2849F47BF959D956850CE929851F"
-        "0D8115F635B105EE2E4E15D04B2454BF6F4FADF034B10403119CD8E3B92FCC5B",
-        16
+        "0D8115F635B105EE2E4E15D04B2454BF6F4FADF034B10403119CD8E3B92FCC5B"
     )
     DH_GENERATOR = 3
     
+    # С gmpy2 параметры сразу хранятся в виде mpz, чтобы не конвертировать
+    # их при каждом звонке
+    if gmpy2 is not None:
+        if hasattr(gmpy2.mpz, "from_bytes"):
+            DH_PRIME = gmpy2.mpz.from_bytes(DH_PRIME_BYTES, 'big')
+        else:  # gmpy2 < 2.2
+            DH_PRIME = gmpy2.mpz(int.from_bytes(DH_PRIME_BYTES, 'big'))
+        DH_GENERATOR = gmpy2.mpz(DH_GENERATOR)
+    else:
+        DH_PRIME = int.from_bytes(DH_PRIME_BYTES, 'big')
+    
+    ENTITY_CACHE_SIZE = 256  # Сколько найденных пользователей держать в кэше
+    DH_POOL_SIZE = 8         # Сколько параметров DH генерировать заранее
+    
     def __init__(self, api_id: int, api_hash: str, session_name: str = SESSION_FILE):
         self.api_id = api_id
         self.api_hash = api_hash
         self.session_name = session_name
         self.client: Optional[TelegramClient] = None
         self.me = None
+        self._entity_cache: dict[str, tuple[types.InputPeerUser, str]] = {}
+        self._dh_pool: Optional[asyncio.Queue] = None
+        self._dh_task: Optional[asyncio.Task] = None
     
     async def connect(self) -> bool:
         """Подключение и авторизация"""
@@ -98,9 +155,14 @@ class TelegramCaller:
         await self.client.connect()
         
         if not await self.client.is_user_authorized():
-            return await self._authorize()
+            if not await self._authorize():
+                return False
+        else:
+            self.me = await self.client.get_me()
         
-        self.me = await self.client.get_me()
+        # Пока пользователь вводит команды, заранее готовим параметры DH
+        self._dh_pool = asyncio.Queue(maxsize=self.DH_POOL_SIZE)
+        self._dh_task = asyncio.create_task(self._refill_dh())
         return True
     
     async def _authorize(self) -> bool:
@@ -109,7 +171,7 @@ class TelegramCaller:
         print("─" * 40)
         
         while True:
-            phone = input("Введите номер телефона (с +): ").strip()
+            phone = (await ainput("Введите номер телефона (с +): ")).strip()
             if not phone:
                 continue
             
@@ -123,7 +185,7 @@ class TelegramCaller:
                 return False
         
         while True:
-            code = input("Введите код из Telegram: ").strip()
+            code = (await ainput("Введите код из Telegram: ")).strip()
             if not code:
                 continue
             
@@ -135,7 +197,7 @@ class TelegramCaller:
             except SessionPasswordNeededError:
                 # Двухфакторная аутентификация
                 print("\n🔐 Требуется пароль двухфакторной аутентификации")
-                password = input("Введите пароль: ").strip()
+                password = (await ainput("Введите пароль: ")).strip()
                 try:
                     await self.client.sign_in(password=password)
                     break
@@ -146,13 +208,96 @@ class TelegramCaller:
         self.me = await self.client.get_me()
         return True
     
-    def _generate_dh_params(self) -> tuple[bytes, int]:
-        """Генерация параметров Diffie-Hellman"""
-        private_key = secrets.randbits(256)
-        g_a = pow(self.DH_GENERATOR, private_key, self.DH_PRIME)
+    def _generate_dh_params(self) -> tuple[bytes, bytes, int]:
+        """Генерация параметров Diffie-Hellman и random_id звонка"""
+        # Один вызов urandom на приватный ключ (32 байта) и random_id (4 байта)
+        raw = os.urandom(36)
+        private_key = int.from_bytes(raw[:32], 'big')
+        random_id = int.from_bytes(raw[32:], 'big') & 0x7FFFFFFF
+        # g^a по предвычисленной таблице: одно умножение на каждый байт ключа
+        table = _build_dh_table(self.DH_GENERATOR, self.DH_PRIME)
+        g_a = 1
+        for row, byte in zip(reversed(table), private_key.to_bytes(32, 'big')):
+            if byte:
+                g_a = g_a * row[byte] % self.DH_PRIME
+        # mpz (gmpy2 2.2+) и int оба умеют to_bytes — конвертируем прямо из GMP.
+        # Наружу отдаём эти же байты: в таком виде g_a и уходит в протокол
+        if not hasattr(g_a, 'to_bytes'):  # gmpy2 < 2.2
+            g_a = int(g_a)
         g_a_bytes = g_a.to_bytes(256, byteorder='big')
-        g_a_hash = hashlib.sha256(g_a_bytes).digest()
-        return g_a_hash, g_a
+        g_a_hash = _sha256(g_a_bytes).digest()
+        return g_a_hash, g_a_bytes, random_id
+    
+    async def _gen_dh_async(self) -> tuple[bytes, bytes, int]:
+        """Генерация параметров DH в отдельном потоке, не блокируя event loop"""
+        return await asyncio.to_thread(self._generate_dh_params)
+    
+    async def _refill_dh(self):
+        """Фоновое пополнение пула параметров DH"""
+        while True:
+            await self._dh_pool.put(await self._gen_dh_async())
+    
+    async def _next_dh(self) -> tuple[bytes, bytes, int]:
+        """Параметры DH из пула, а если он пуст — сгенерированные на месте"""
+        if self._dh_pool is not None and not self._dh_pool.empty():
+            return self._dh_pool.get_nowait()
+        return await self._gen_dh_async()
+    
+    @staticmethod
+    def _normalize(username: str) -> str:
+        """Нормализация username: без пробелов и @"""
+        target = username.strip()
+        if target.startswith("@"):
+            target = target[1:]
+        return target
+    
+    async def _resolve(self, username: str) -> tuple[types.InputPeerUser, str]:
+        """Получение пользователя по username или ID (с кэшированием)"""
+        target = self._normalize(username)
+        key = target.lower()
+        
+        cached = self._entity_cache.get(key)
+        if cached is not None:
+            return cached
+        
+        # Числовой ID (в том числе отрицательный); всё остальное, включая
+        # номера телефонов "+7...", Telethon разбирает как строку
+        if target.removeprefix('-').isdigit():
+            user = await self.client.get_entity(int(target))
+        else:
+            user = await self.client.get_entity(target)
+        
+        user_display = f"@{user.username}" if user.username else f"ID:{user.id}"
+        peer = await self.client.get_input_entity(user)
+        
+        # При переполнении выбрасываем самую старую запись
+        if len(self._entity_cache) >= self.ENTITY_CACHE_SIZE:
+            del self._entity_cache[next(iter(self._entity_cache))]
+        self._entity_cache[key] = (peer, user_display)
+        return peer, user_display
+    
+    def _resolve_error(self, username: str, error: Exception) -> CallResult:
+        """Преобразование ошибки поиска пользователя в результат"""
+        if isinstance(error, ValueError):
+            return CallResult(username, CallStatus.NOT_FOUND, "Пользователь не найден")
+        return self._call_error(username, error)
+    
+    def _call_error(self, username: str, error: Exception) -> CallResult:
+        """Преобразование ошибки звонка в результат"""
+        if isinstance(error, UserPrivacyRestrictedError):
+            sys.stdout.write(f"   🔒 {username} — приватность запрещает звонки\n")
+            return CallResult(username, CallStatus.PRIVACY, "Звонки запрещены настройками приватности")
+        
+        if isinstance(error, FloodWaitError):
+            sys.stdout.write(f"   ⏳ Flood wait: {error.seconds}с\n")
+            return CallResult(username, CallStatus.FLOOD, f"Подождите {error.seconds}с")
+        
+        error_msg = str(error)
+        if "PRIVACY" in error_msg.upper():
+            sys.stdout.write(f"   🔒 {username} — приватность\n")
+            return CallResult(username, CallStatus.PRIVACY, "Звонки запрещены")
+        sys.stdout.write(f"   ❌ {username} — ошибка: {error_msg[:50]}\n")
+        return CallResult(username, CallStatus.FAILED, error_msg)
     
     async def call(
         self,
@@ -168,51 +313,79 @@ class TelegramCaller:
             duration: Длительность звонка (секунды)
             message: Сообщение перед звонком (опционально)
         """
-        # Нормализуем username
-        target = username.strip()
-        if target.startswith("@"):
-            target = target[1:]
+        try:
+            user, user_display = await self._resolve(username)
+        except Exception as e:
+            return self._resolve_error(username, e)
         
+        return await self._place_call(username, user, user_display, duration, message)
+    
+    async def _place_call(
+        self,
+        username: str,
+        user: types.InputPeerUser,
+        user_display: str,
+        duration: float = DEFAULT_RING_DURATION,
+        message: Optional[str] = None,
+        dh: Optional[tuple[bytes, bytes, int]] = None
+    ) -> CallResult:
+        """Звонок уже найденному пользователю"""
         try:
-            # Получаем пользователя
-            try:
-                if target.isdigit():
-                    user = await self.client.get_entity(int(target))
-                else:
-                    user = await self.client.get_entity(target)
-            except ValueError:
-                return CallResult(username, CallStatus.NOT_FOUND, "Пользователь не найден")
-            
-            user_display = f"@{user.username}" if user.username else f"ID:{user.id}"
-            
-            # Отправляем сообщение если указано
-            if message:
-                await self.client.send_message(user, message)
-                await asyncio.sleep(0.3)
-            
             # Генерируем параметры DH
-            g_a_hash, _ = self._generate_dh_params()
+            g_a_hash, _, random_id = dh or await self._next_dh()
             
-            # Инициируем звонок
-            result = await self.client(functions.phone.RequestCallRequest(
+            request = functions.phone.RequestCallRequest(
                 user_id=user,
                 g_a_hash=g_a_hash,
-                protocol=types.PhoneCallProtocol(
-                    min_layer=92,
-                    max_layer=92,
-                    library_versions=['5.0.0', '6.0.0'],
-                    udp_p2p=True,
-                    udp_reflector=True
-                ),
+                protocol=_CALL_PROTOCOL,
                 video=False,
-                random_id=secrets.randbelow(2**31)
-            ))
+                random_id=random_id
+            )
+            
+            # Инициируем звонок
+            if message:
+                # Разметка как у send_message (parse mode клиента по умолчанию)
+                parser = utils.sanitize_parse_mode(self.client.parse_mode)
+                text, entities = parser.parse(message) if parser else (message, [])
+                
+                # Сообщение и звонок уходят одним контейнером через invokeAfterMsg:
+                # сервер выполнит их по порядку без лишнего RTT и паузы
+                try:
+                    _, result = await self.client([
+                        functions.messages.SendMessageRequest(
+                            peer=user, message=text, entities=entities or None
+                        ),
+                        request
+                    ], ordered=True)
+                except MultiError as e:
+                    message_error, call_error = e.exceptions
+                    result = e.results[-1]
+                    if result is None and isinstance(message_error, FloodWaitError):
+                        # В контейнере Telethon не пережидает flood wait сам, а звонок
+                        # после упавшего сообщения отклоняется (MSG_WAIT_FAILED).
+                        # Повторяем по-старому: send_message переждёт короткий flood
+                        # wait или бросит FloodWaitError, затем звонок
+                        await self.client.send_message(user, message)
+                        result = await self.client(request)
+                    else:
+                        if message_error is not None:
+                            sys.stdout.write(f"   ⚠️  Сообщение не отправлено: {message_error}\n")
+                        if result is None:
+                            if not isinstance(call_error, (FloodWaitError, MsgWaitFailedError)):
+                                raise call_error
+                            # Звонок отклонён из-за сообщения или flood wait —
+                            # повторяем отдельным запросом, как раньше
+                            result = await self.client(request)
+            else:
+                result = await self.client(request)
             
             phone_call = result.phone_call
             call_id = phone_call.id
             access_hash = phone_call.access_hash
             
-            print(f"   📞 Звоню {user_display}...", end="", flush=True)
+            # Строка должна появиться сразу, пока идёт звонок
+            sys.stdout.write(f"   📞 Звоню {user_display}...")
+            sys.stdout.flush()
             
             # Ждём указанное время
             await asyncio.sleep(duration)
@@ -228,24 +401,16 @@ class TelegramCaller:
             except Exception:
                 pass  # Игнорируем ошибки при сбросе
             
-            print(f" ✅ ({duration:.1f}с)")
-            return CallResult(username, CallStatus.SUCCESS, f"Звонок {duration:.1f}с")
-            
-        except UserPrivacyRestrictedError:
-            print(f"   🔒 {username} — приватность запрещает звонки")
-            return CallResult(username, CallStatus.PRIVACY, "Звонки запрещены настройками приватности")
-            
-        except FloodWaitError as e:
-            print(f"   ⏳ Flood wait: {e.seconds}с")
-            return CallResult(username, CallStatus.FLOOD, f"Подождите {e.seconds}с")
+            elapsed = f"{duration:.1f}с"
+            sys.stdout.write(f" ✅ ({elapsed})\n")
+            return CallResult(username, CallStatus.SUCCESS, f"Звонок {elapsed}")
             
         except Exception as e:
-            error_msg = str(e)
-            if "PRIVACY" in error_msg.upper():
-                print(f"   🔒 {username} — приватность")
-                return CallResult(username, CallStatus.PRIVACY, "Звонки запрещены")
-            print(f"   ❌ {username} — ошибка: {error_msg[:50]}")
-            return CallResult(username, CallStatus.FAILED, error_msg)
+            result = self._call_error(username, e)
+            if result.status is CallStatus.PRIVACY:
+                # Пользователь закрыл звонки — не доверяем кэшу
+                self._entity_cache.pop(self._normalize(username).lower(), None)
+            return result
     
     async def call_multiple(
         self,
@@ -254,10 +419,34 @@ class TelegramCaller:
         delay: float = 1.0
     ) -> list[CallResult]:
         """Звонок нескольким пользователям"""
+        # Пользователей ищем параллельно (каждого — один раз), а звоним строго
+        # по очереди
+        keys = [self._normalize(username).lower() for username in usernames]
+        unique: dict[str, str] = {}
+        for key, username in zip(keys, usernames):
+            unique.setdefault(key, username)
+        lookups = await asyncio.gather(
+            *[self._resolve(username) for username in unique.values()],
+            return_exceptions=True
+        )
+        by_key = dict(zip(unique, lookups))
+        resolved = [by_key[key] for key in keys]
+        
+        # Параметры DH генерируем заранее, только для найденных. Потоки не дают
+        # параллелизма (умножения держат GIL), но event loop не блокируется
+        found = sum(not isinstance(entry, Exception) for entry in resolved)
+        dh_params = iter(await asyncio.gather(*[self._next_dh() for _ in range(found)]))
+        
         results = []
-        for i, username in enumerate(usernames, 1):
+        for i, (username, entry) in enumerate(zip(usernames, resolved), 1):
             print(f"\n[{i}/{len(usernames)}] {username}")
-            result = await self.call(username, duration)
+            if isinstance(entry, Exception):
+                result = self._resolve_error(username, entry)
+            else:
+                user, user_display = entry
+                result = await self._place_call(
+                    username, user, user_display, duration, dh=next(dh_params)
+                )
             results.append(result)
             if i < len(usernames):
                 await asyncio.sleep(delay)
@@ -265,6 +454,9 @@ class TelegramCaller:
     
     async def disconnect(self):
         """Отключение"""
+        if self._dh_task:
+            self._dh_task.cancel()
+            self._dh_task = None
         if self.client:
             await self.client.disconnect()
 
@@ -273,8 +465,43 @@ class TelegramCaller:
 # УТИЛИТЫ
 # ═══════════════════════════════════════════════════════════════════════════════
 
-def load_config() -> tuple[Optional[int], Optional[str]]:
-    """Загрузка сохранённых API credentials"""
+async def ainput(prompt: str = "") -> str:
+    """
+    input() без блокировки event loop
+    
+    Читает в daemon-потоке: при Ctrl+C процесс завершается сразу, не дожидаясь,
+    пока пользователь нажмёт Enter (поток executor'а держал бы выход).
+    """
+    loop = asyncio.get_running_loop()
+    future = loop.create_future()
+    
+    def deliver(setter, value):
+        if not future.done():
+            setter(value)
+    
+    def reader():
+        try:
+            line = input(prompt)
+        except BaseException as e:  # EOFError и т.п. — отдаём в корутину
+            callback = (deliver, future.set_exception, e)
+        else:
+            callback = (deliver, future.set_result, line)
+        try:
+            loop.call_soon_threadsafe(*callback)
+        except RuntimeError:
+            pass  # Event loop уже закрыт
+    
+    threading.Thread(target=reader, daemon=True).start()
+    return await future
+
+
+# Юзернеймы/ID во вводе: разделены пробелами или запятыми (@ снимает _resolve)
+_TOKEN_RE = re.compile(r"[^\s,]+")
+
+
+@functools.lru_cache(maxsize=1)
+def _load_config_cached() -> tuple[Optional[int], Optional[str]]:
+    """Чтение API credentials с диска (результат кэшируется)"""
     if Path(CONFIG_FILE).exists():
         try:
             with open(CONFIG_FILE, 'r') as f:
@@ -286,10 +513,16 @@ def load_config() -> tuple[Optional[int], Optional[str]]:
     return None, None
 
 
+def load_config() -> tuple[Optional[int], Optional[str]]:
+    """Загрузка сохранённых API credentials"""
+    return _load_config_cached()
+
+
 def save_config(api_id: int, api_hash: str):
     """Сохранение API credentials"""
     with open(CONFIG_FILE, 'w') as f:
         f.write(f"{api_id}\n{api_hash}\n")
+    _load_config_cached.cache_clear()
 
 
 def print_banner():
@@ -338,7 +571,9 @@ async def interactive_mode(caller: TelegramCaller):
     while True:
         try:
             print()
-            user_input = input("📞 > ").strip()
+            # Ввод не блокирует event loop: Telethon продолжает обрабатывать
+            # обновления и keepalive, пока пользователь думает
+            user_input = (await ainput("📞 > ")).strip()
             
             if not user_input:
                 continue
@@ -398,11 +633,7 @@ async def interactive_mode(caller: TelegramCaller):
             
             # Звонки
             # Парсим юзернеймы (разделённые пробелами или запятыми)
-            usernames = []
-            for part in user_input.replace(",", " ").split():
-                part = part.strip()
-                if part:
-                    usernames.append(part)
+            usernames = _TOKEN_RE.findall(user_input)
             
             if not usernames:
                 continue
@@ -414,7 +645,8 @@ async def interactive_mode(caller: TelegramCaller):
                 await caller.call_multiple(usernames, ring_duration)
                 print(f"\n✅ Завершено")
         
-        except KeyboardInterrupt:
+        except (KeyboardInterrupt, asyncio.CancelledError):
+            # С Python 3.11 asyncio.run превращает Ctrl+C в отмену задачи
             print("\n\n👋 Прервано. До свидания!")
             break
         except EOFError:
@@ -426,7 +658,7 @@ async def main():
     print_banner()
     
     # Пробуем загрузить сохранённые credentials
-    api_id, api_hash = load_config()
+    api_id, api_hash = await asyncio.to_thread(load_config)
     
     if not api_id or not api_hash:
         print("🔧 Первоначальная настройка")
@@ -436,13 +668,13 @@ async def main():
         
         while True:
             try:
-                api_id_input = input("API ID: ").strip()
+                api_id_input = (await ainput("API ID: ")).strip()
                 api_id = int(api_id_input)
                 break
             except ValueError:
                 print("❌ API ID должен быть числом")
         
-        api_hash = input("API Hash: ").strip()
+        api_hash = (await ainput("API Hash: ")).strip()
         
         # Сохраняем для будущих запусков
         save_config(api_id, api_hash)